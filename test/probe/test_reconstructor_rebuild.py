@@ -17,7 +17,7 @@
 import errno
 import json
 from contextlib import contextmanager
-from hashlib import md5
+from hashlib import md5, sha1
 import unittest
 import uuid
 import shutil
@@ -25,6 +25,7 @@ import random
 import os
 import time
 import six
+from eventlet import GreenPool, spawn, tpool
 
 from swift.common.direct_client import DirectClientException
 from test.probe.common import ECProbeTest
@@ -32,21 +33,50 @@ from test.probe.common import ECProbeTest
 from swift.common import direct_client
 from swift.common.storage_policy import EC_POLICY
 from swift.common.manager import Manager
+from swift.obj.diskfile import get_data_dir
 
 from swiftclient import client, ClientException
 
+# (failed, non-durable) node indexes for
+# test_rebuild_with_missing_frags_and_non_durable_frags
+MISSING_AND_NON_DURABLE_SCENARIOS = (
+    ((0, 2), (4,)),
+    ((0, 4), (2,)),
+)
+# why 2 reconstructor cycles? consider missing fragment on nodes 0, 1 and
+# missing durable on node 2: first reconstructor cycle on node 3 will make
+# node 2 durable, first cycle on node 5 will rebuild on node 0; second cycle
+# on node 0 or 2 will rebuild on node 1. Note that it is possible, that
+# reconstructor processes on each node run in order such that all rebuild
+# complete in once cycle, but that is not guaranteed, we allow 2 cycles to be
+# sure.
+MISSING_ADJACENT_AND_NON_DURABLE_SCENARIOS = (
+    ((0, 1), (2,)),
+    ((0, 2), (1,)),
+)
+# why 3 reconstructor cycles? consider missing fragment on node 0 and single
+# durable on node 3: first reconstructor cycle on node 3 will make nodes 2 and
+# 4 durable, second cycle on nodes 2 and 4 will make node 1 and 5 durable,
+# third cycle on nodes 1 or 5 will reconstruct the missing fragment on node 0.
+MISSING_AND_MOSTLY_NON_DURABLE_SCENARIOS = (
+    ((0, 2), (1, 3, 5)),
+    ((0,), (1, 2, 4, 5)),
+)
+
 
 class Body(object):
 
     def __init__(self, total=3.5 * 2 ** 20):
         self.total = int(total)
-        self.hasher = md5()
         self.size = 0
-        self.chunk = b'test' * 16 * 2 ** 10
+        self.chunk = b'test' * (16 * 2 ** 10)
 
     @property
     def etag(self):
-        return self.hasher.hexdigest()
+        # every chunk is identical, so rather than updating a hasher on each
+        # iteration just digest whatever has been sent so far in one go
+        sent = self.chunk * (self.size // len(self.chunk))
+        return md5(sent).hexdigest()
 
     def __iter__(self):
         return self
@@ -55,7 +85,6 @@ class Body(object):
         if self.size > self.total:
             raise StopIteration()
         self.size += len(self.chunk)
-        self.hasher.update(self.chunk)
         return self.chunk
 
     # for py2 compat
@@ -69,11 +98,17 @@ class TestReconstructorRebuild(ECProbeTest):
 
     def setUp(self):
         super(TestReconstructorRebuild, self).setUp()
+        # set SWIFT_PROBE_SEED to repeat the same random choice of nodes
+        seed = os.environ.get('SWIFT_PROBE_SEED')
+        if seed is not None:
+            random.seed(seed)
         self.container_name = self._make_name('container-')
         self.object_name = self._make_name('object-')
         # sanity
         self.assertEqual(self.policy.policy_type, EC_POLICY)
         self.reconstructor = Manager(["object-reconstructor"])
+        # every backend request needs this, so only work it out the once
+        self.policy_index = int(self.policy)
 
         # create EC container
         headers = {'X-Storage-Policy': self.policy.name}
@@ -90,6 +125,13 @@ class TestReconstructorRebuild(ECProbeTest):
 
         self.opart, self.onodes = self.object_ring.get_nodes(
             self.account, self.container_name, self.object_name)
+        # resolving these reads server configs, so only do it the once
+        self.device_dirs = [self.device_dir('object', node)
+                            for node in self.onodes]
+        self.part_dirs = [
+            os.path.join(device_dir, get_data_dir(self.policy),
+                         str(self.opart))
+            for device_dir in self.device_dirs]
 
         # stash frag etags and metadata for later comparison
         self.frag_headers, self.frag_etags = self._assert_all_nodes_have_frag()
@@ -113,18 +155,15 @@ class TestReconstructorRebuild(ECProbeTest):
                                       contents=contents, headers=headers)
 
     def proxy_get(self):
-        # GET object
+        # GET object; it's only a few MiB, so read the whole body in one go
+        # and hash it with a single call rather than chunk by chunk
         headers, body = client.get_object(self.url, self.token,
                                           self.container_name,
-                                          self.object_name,
-                                          resp_chunk_size=64 * 2 ** 10)
-        resp_checksum = md5()
-        for chunk in body:
-            resp_checksum.update(chunk)
-        return headers, resp_checksum.hexdigest()
+                                          self.object_name)
+        return headers, md5(body).hexdigest()
 
     def direct_get(self, node, part, require_durable=True, extra_headers=None):
-        req_headers = {'X-Backend-Storage-Policy-Index': int(self.policy)}
+        req_headers = {'X-Backend-Storage-Policy-Index': self.policy_index}
         if extra_headers:
             req_headers.update(extra_headers)
         if not require_durable:
@@ -140,30 +179,52 @@ class TestReconstructorRebuild(ECProbeTest):
         headers, data = direct_client.direct_get_object(
             node, part, acc, con, obj, headers=req_headers,
             resp_chunk_size=64 * 2 ** 20)
-        hasher = md5()
+        # frag checksums are only ever compared with each other, never with
+        # an etag from the server, so use the quicker sha1 rather than md5
+        hasher = sha1()
         for chunk in data:
             hasher.update(chunk)
         return headers, hasher.hexdigest()
 
+    def _direct_get_many(self, nodes, part, **kwargs):
+        # direct_client connections are green, so GET from all the nodes
+        # concurrently; returns (node, greenthread) pairs in node order, and
+        # waiting on a greenthread returns or raises whatever direct_get did
+        pool = GreenPool(len(nodes))
+        return [(node, pool.spawn(self.direct_get, node, part, **kwargs))
+                for node in nodes]
+
+    def _make_frag_non_durable(self, part_dir):
+        # the partition only holds our one object, so rather than walking the
+        # whole tree descend <part>/<suffix>/<hash>/ and stop at the first
+        # durable .data file
+        for suffix in os.listdir(part_dir):
+            suffix_dir = os.path.join(part_dir, suffix)
+            if not os.path.isdir(suffix_dir):
+                continue  # e.g. hashes.pkl
+            for hsh in os.listdir(suffix_dir):
+                hash_dir = os.path.join(suffix_dir, hsh)
+                for fname in os.listdir(hash_dir):
+                    if fname.endswith('#d.data'):
+                        non_durable_fname = fname[:-len('#d.data')] + '.data'
+                        os.rename(os.path.join(hash_dir, fname),
+                                  os.path.join(hash_dir, non_durable_fname))
+                        return
+
     def _break_nodes(self, failed, non_durable):
         # delete partitions on the failed nodes and remove durable marker from
         # non-durable nodes
         for i, node in enumerate(self.onodes):
-            part_dir = self.storage_dir('object', node, part=self.opart)
+            part_dir = self.part_dirs[i]
             if i in failed:
                 shutil.rmtree(part_dir, True)
                 try:
                     self.direct_get(node, self.opart)
                 except direct_client.DirectClientException as err:
                     self.assertEqual(err.http_status, 404)
-            elif i in non_durable:
-                for dirs, subdirs, files in os.walk(part_dir):
-                    for fname in files:
-                        if fname.endswith('.data'):
-                            non_durable_fname = fname.replace('#d', '')
-                            os.rename(os.path.join(dirs, fname),
-                                      os.path.join(dirs, non_durable_fname))
-                            break
+                continue  # hashes.pkl went with the partition
+            if i in non_durable:
+                self._make_frag_non_durable(part_dir)
                 headers, etag = self.direct_get(node, self.opart,
                                                 require_durable=False)
                 self.assertNotIn('X-Backend-Durable-Timestamp', headers)
@@ -181,10 +242,11 @@ class TestReconstructorRebuild(ECProbeTest):
         failures = []
         frag_etags = {}
         frag_headers = {}
-        for node in self.onodes:
+        gets = self._direct_get_many(self.onodes, self.opart,
+                                     extra_headers=extra_headers)
+        for node, get_thread in gets:
             try:
-                headers, etag = self.direct_get(node, self.opart,
-                                                extra_headers=extra_headers)
+                headers, etag = get_thread.wait()
                 frag_etags[node['index']] = etag
                 del headers['Date']  # Date header will vary so remove it
                 frag_headers[node['index']] = headers
@@ -224,82 +286,60 @@ class TestReconstructorRebuild(ECProbeTest):
                 self.assertIn(key, headers)
                 self.assertEqual(self.headers_post[key], headers[key])
 
-        # fire up reconstructor
+        # fire up reconstructor; each once() already spawns the reconstructor
+        # for every node's config before waiting on any of them, but the
+        # cycles themselves must not overlap since later cycles rely on the
+        # repairs made by earlier ones
         for i in range(reconstructor_cycles):
             self.reconstructor.once()
 
-        # check GET via proxy returns expected data and metadata
+        # check GET via proxy returns expected data and metadata; neither
+        # check changes anything on disk, so the fragment GETs run on the hub
+        # while the (non-green) proxy GET waits in a native thread
         with self._annotate_failure_with_scenario(failed, non_durable):
-            headers, etag = self.proxy_get()
-            self.assertEqual(self.etag, etag)
-            for key in self.headers_post:
-                self.assertIn(key, headers)
-                self.assertEqual(self.headers_post[key], headers[key])
+            frag_check = spawn(self._assert_all_nodes_have_frag)
+            try:
+                headers, etag = tpool.execute(self.proxy_get)
+                self.assertEqual(self.etag, etag)
+                for key in self.headers_post:
+                    self.assertIn(key, headers)
+                    self.assertEqual(self.headers_post[key], headers[key])
+            except BaseException:
+                frag_check.kill()
+                raise
         # check all frags are intact, durable and have expected metadata
         with self._annotate_failure_with_scenario(failed, non_durable):
-            frag_headers, frag_etags = self._assert_all_nodes_have_frag()
+            frag_headers, frag_etags = frag_check.wait()
             self.assertEqual(self.frag_etags, frag_etags)
             # self._frag_headers include X-Backend-Durable-Timestamp so this
             # assertion confirms that the rebuilt frags are all durable
             self.assertEqual(self.frag_headers, frag_headers)
 
-    def test_rebuild_missing_frags(self):
-        # build up a list of node lists to kill data from,
-        # first try a single node
+    def test_rebuild_missing_or_non_durable_frags(self):
+        # build up a list of node lists to kill data from or make
+        # non-durable, first try a single node
         # then adjacent nodes and then nodes >1 node apart
         single_node = (random.randint(0, 5),)
         adj_nodes = (0, 5)
         far_nodes = (0, 4)
 
+        # every scenario ends with all frags rebuilt, so they can all share
+        # the object from setUp rather than paying for a fresh cluster and
+        # PUT per test method
         for failed_nodes in [single_node, adj_nodes, far_nodes]:
             self._test_rebuild_scenario(failed_nodes, [], 1)
-
-    def test_rebuild_non_durable_frags(self):
-        # build up a list of node lists to make non-durable,
-        # first try a single node
-        # then adjacent nodes and then nodes >1 node apart
-        single_node = (random.randint(0, 5),)
-        adj_nodes = (0, 5)
-        far_nodes = (0, 4)
-
         for non_durable_nodes in [single_node, adj_nodes, far_nodes]:
             self._test_rebuild_scenario([], non_durable_nodes, 1)
 
     def test_rebuild_with_missing_frags_and_non_durable_frags(self):
         # pick some nodes with parts deleted, some with non-durable fragments
-        scenarios = [
-            # failed, non-durable
-            ((0, 2), (4,)),
-            ((0, 4), (2,)),
-        ]
-        for failed, non_durable in scenarios:
-            self._test_rebuild_scenario(failed, non_durable, 3)
-        scenarios = [
-            # failed, non-durable
-            ((0, 1), (2,)),
-            ((0, 2), (1,)),
-        ]
-        for failed, non_durable in scenarios:
-            # why 2 repeats? consider missing fragment on nodes 0, 1  and
-            # missing durable on node 2: first reconstructor cycle on node 3
-            # will make node 2 durable, first cycle on node 5 will rebuild on
-            # node 0; second cycle on node 0 or 2 will rebuild on node 1. Note
-            # that it is possible, that reconstructor processes on each node
-            # run in order such that all rebuild complete in once cycle, but
-            # that is not guaranteed, we allow 2 cycles to be sure.
-            self._test_rebuild_scenario(failed, non_durable, 2)
-        scenarios = [
-            # failed, non-durable
-            ((0, 2), (1, 3, 5)),
-            ((0,), (1, 2, 4, 5)),
-        ]
-        for failed, non_durable in scenarios:
-            # why 3 repeats? consider missing fragment on node 0 and single
-            # durable on node 3: first reconstructor cycle on node 3 will make
-            # nodes 2 and 4 durable, second cycle on nodes 2 and 4 will make
-            # node 1 and 5 durable, third cycle on nodes 1 or 5 will
-            # reconstruct the missing fragment on node 0.
-            self._test_rebuild_scenario(failed, non_durable, 3)
+        for scenarios, reconstructor_cycles in (
+                (MISSING_AND_NON_DURABLE_SCENARIOS, 3),
+                (MISSING_ADJACENT_AND_NON_DURABLE_SCENARIOS, 2),
+                (MISSING_AND_MOSTLY_NON_DURABLE_SCENARIOS, 3)):
+            for failed, non_durable in scenarios:
+                self._test_rebuild_scenario(failed, non_durable,
+                                            reconstructor_cycles)
 
     def test_rebuild_partner_down(self):
         # we have to pick a lower index because we have few handoffs
@@ -312,7 +352,7 @@ class TestReconstructorRebuild(ECProbeTest):
             partner_node, self.opart)
 
         # and 507 the failed partner device
-        device_path = self.device_dir('object', partner_node)
+        device_path = self.device_dirs[self.onodes.index(partner_node)]
         self.kill_drive(device_path)
 
         # reconstruct from the primary, while one of it's partners is 507'd
@@ -428,7 +468,7 @@ class TestReconstructorRebuild(ECProbeTest):
                 direct_client.direct_head_object(
                     post_fail_node, opart, self.account, self.container_name,
                     self.object_name, headers={
-                        'X-Backend-Storage-Policy-Index': int(self.policy)})
+                        'X-Backend-Storage-Policy-Index': self.policy_index})
             except direct_client.ClientException as client_err:
                 if client_err.http_status != 404:
                     raise
@@ -453,7 +493,7 @@ class TestReconstructorRebuild(ECProbeTest):
             headers = direct_client.direct_head_object(
                 node, opart, self.account, self.container_name,
                 self.object_name, headers={
-                    'X-Backend-Storage-Policy-Index': int(self.policy)})
+                    'X-Backend-Storage-Policy-Index': self.policy_index})
             self.assertNotIn('X-Delete-At', headers)
 
 
@@ -20,7 +20,6 @@ import unittest
 import uuid
 import random
 import shutil
-from collections import defaultdict
 
 from test.probe.common import ECProbeTest, Body
 
@@ -263,10 +262,10 @@ class TestReconstructorRevert(ECProbeTest):
 
         # find a primary server that only has one of it's devices in the
         # primary node list
-        group_nodes_by_config = defaultdict(list)
-        for n in onodes:
-            group_nodes_by_config[self.config_number(n)].append(n)
-        for config_number, node_list in group_nodes_by_config.items():
+        nodes_by_config = sorted(onodes, key=self.config_number)
+        for config_number, node_group in itertools.groupby(
+                nodes_by_config, key=self.config_number):
+            node_list = list(node_group)
             if len(node_list) == 1:
                 break
         else:
@@ -15,9 +15,10 @@
 
 import logging
 import os
+import threading
 import unittest
 
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from six.moves import urllib
 
 from swift.common.utils import config_true_value
@@ -25,6 +26,8 @@ from swift.common.utils import config_true_value
 from test import get_config
 
 _CONFIG = None
+_CONFIG_LOCK = threading.Lock()
+_CLIENTS = {}
 
 
 # boto's loggign can get pretty noisy; require opt-in to see it all
@@ -40,7 +43,9 @@ class ConfigError(Exception):
 def get_opt_or_error(option):
     global _CONFIG
     if _CONFIG is None:
-        _CONFIG = get_config('s3api_test')
+        with _CONFIG_LOCK:
+            if _CONFIG is None:
+                _CONFIG = get_config('s3api_test')
 
     value = _CONFIG.get(option)
     if not value:
@@ -79,7 +84,20 @@ def get_s3_client(user=1, signature_version='s3v4', addressing_style='path'):
     :param addressing_style: One of:
         path -- produces URLs like ``http(s)://host.domain/bucket/key``
         virtual -- produces URLs like ``http(s)://bucket.host.domain/key``
+
+    Clients are cached, so repeated calls with the same arguments return
+    the same client.
     '''
+    key = (user, signature_version, addressing_style)
+    if key not in _CLIENTS:
+        _CLIENTS[key] = _make_s3_client(*key)
+    return _CLIENTS[key]
+
+
+def _make_s3_client(user, signature_version, addressing_style):
+    # boto3 is slow to import, so only pay for it once a client is wanted
+    import boto3
+
     endpoint = get_opt_or_error('endpoint')
     scheme = urllib.parse.urlsplit(endpoint).scheme
     if scheme not in ('http', 'https'):
@@ -122,14 +140,27 @@ class BaseS3TestCase(unittest.TestCase):
 
     @classmethod
     def clear_bucket(cls, client, bucket):
-        for key in client.list_objects(Bucket=bucket).get('Contents', []):
-            client.delete_key(Bucket=bucket, Key=key['Name'])
+        # a listing page holds at most 1000 keys, which is also as many as a
+        # single DeleteObjects request will take
+        paginator = client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket):
+            objects = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+            if objects:
+                client.delete_objects(Bucket=bucket, Delete={
+                    'Objects': objects, 'Quiet': True})
+
+    @classmethod
+    def delete_bucket(cls, client, bucket):
+        cls.clear_bucket(client, bucket)
+        client.delete_bucket(Bucket=bucket)
 
     @classmethod
     def clear_account(cls, client):
-        for bucket in client.list_buckets()['Buckets']:
-            cls.clear_bucket(client, bucket['Name'])
-            client.delete_bucket(Bucket=bucket['Name'])
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = [executor.submit(cls.delete_bucket, client, b['Name'])
+                       for b in client.list_buckets()['Buckets']]
+        for future in futures:
+            future.result()  # re-raise any error
 
     def tearDown(self):
         client = self.get_s3_client(1)